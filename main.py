@@ -1,18 +1,27 @@
 """
 Main entry point - Run the FastAPI server
 """
+import sys
 import uvicorn
-from src.config import settings
+from src.config import settings, secret_key_generated
 
 if __name__ == "__main__":
     print(f"Starting {settings.PROJECT_NAME}...")
     print(f"API will be available at http://{settings.HOST}:{settings.PORT}")
     if settings.DEBUG:
         print(f"API docs at http://{settings.HOST}:{settings.PORT}/docs")
+    workers = 1 if settings.DEBUG else settings.WORKERS
+    if workers > 1 and secret_key_generated():
+        # Each worker would generate its own key and reject the others' tokens
+        print("SECRET_KEY is not set - running a single worker")
+        workers = 1
     uvicorn.run(
         "src.api:app",
         host=settings.HOST,
         port=settings.PORT,
         reload=settings.DEBUG,
+        workers=workers,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop has no Windows support
+        http="httptools",
         log_level=settings.LOG_LEVEL.lower()
     )
\ No newline at end of file
@@ -1,7 +1,7 @@
 """
 Analytics Features: Summarization, Classification, Pattern Detection
 """
-import json
+import orjson
 from typing import Dict, List
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
@@ -95,7 +95,7 @@ class AnalyticsEngine:
                 if response.startswith("json"):
                     response = response[4:]
             response = response.strip()
-            classification = json.loads(response)
+            classification = orjson.loads(response)
             return classification
         except Exception as e:
             print(f"Classification error: {e}")
@@ -121,7 +121,7 @@ class AnalyticsEngine:
                 if response.startswith("json"):
                     response = response[4:]
             response = response.strip()
-            patterns = json.loads(response)
+            patterns = orjson.loads(response)
             return patterns
         except Exception as e:
             print(f"Pattern detection error: {e}")
@@ -2,17 +2,30 @@
 FastAPI Backend Server - Production Ready
 """
 import os
-import json
+import sys
+import re
+import codecs
+import orjson
+import asyncio
+import hashlib
 import logging
+import tempfile
+import threading
+import multiprocessing
+from functools import lru_cache
 from datetime import datetime, timedelta
 from typing import Optional
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from contextlib import asynccontextmanager
 
+import anyio
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -23,19 +36,23 @@ from src.models import (
 )
 from pydantic import BaseModel as PydanticBaseModel, Field
 from src.database import (
-    init_db, create_user, get_user_by_email, get_user_by_id,
-    create_story, get_story, get_user_stories, create_scene, get_story_scenes,
+    init_db, create_user, get_user_by_email, user_exists,
+    create_story, get_story, get_user_stories, create_scenes_bulk, get_story_scenes,
     log_agent_decision, log_user_query, create_report, set_metadata,
-    update_story, delete_story, archive_story, update_user_username, update_user_password
+    update_story, delete_story, archive_story, update_user_username, update_user_password,
+    update_story_status, update_scene_images, get_archived_stories,
+    search_user_stories, get_story_with_scenes
 )
-from src.scene_generator import SceneGenerator
-from src.image_generator import ImageGenerator
+from src.scene_generator import SceneGenerator, SCENE_GENERATION_TIMEOUT, SCENE_TIMEOUT_MESSAGE
+from src.image_generator import ImageGenerator, OUTPUT_DIR as IMAGE_OUTPUT_DIR, ensure_output_dir, prune_image_cache
 from src.analytics import AnalyticsEngine
+from src.text_extraction import extract_pdf_text, extract_docx_text
 from src.memory import AgentMemory
 from src.config import settings
+from src.cache import TTLCache
 from src.auth import (
     verify_password, get_password_hash, create_access_token,
-    get_user_id_from_token
+    get_token_subject
 )
 
 # Configure logging
@@ -48,18 +65,106 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Rate limiter
-limiter = Limiter(key_func=get_remote_address)
+# Rate limiter - fixed-window keeps a single counter per key (O(1) per hit);
+# moving-window stores every hit and gets expensive under load
+limiter = Limiter(
+    key_func=get_remote_address,
+    strategy="fixed-window",
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+    enabled=settings.RATE_LIMIT_ENABLED
+)
+
+# Matches rate-limit / quota errors from the Google APIs
+RATE_LIMIT_RE = re.compile(r"429|rate[ _]limit|throttled|quota|resourceexhausted", re.IGNORECASE)
+
+# Process pool for CPU-bound PDF/DOCX text extraction (workers start on first use).
+# Never fork: the server process already runs threads that may hold locks
+def new_extraction_executor() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=settings.EXTRACTION_WORKERS,
+        mp_context=multiprocessing.get_context("spawn" if sys.platform == "win32" else "forkserver"),
+    )
+
+EXTRACTION_EXECUTOR = new_extraction_executor()
+_extraction_lock = threading.Lock()
+
+
+def replace_extraction_executor(broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+    """Swap in a fresh pool once a worker died (a broken pool rejects every later job)"""
+    global EXTRACTION_EXECUTOR
+    with _extraction_lock:
+        if EXTRACTION_EXECUTOR is broken:
+            logger.warning("Extraction process pool is broken, starting a new one")
+            EXTRACTION_EXECUTOR = new_extraction_executor()
+            broken.shutdown(wait=False)
+        return EXTRACTION_EXECUTOR
+
+
+async def run_extraction(extract, path: str) -> str:
+    """Run a text extractor in the process pool, recovering from dead pool workers"""
+    loop = asyncio.get_running_loop()
+    executor = EXTRACTION_EXECUTOR
+    try:
+        future = loop.run_in_executor(executor, extract, path)
+    except BrokenProcessPool:
+        # Broken by an earlier job; this one never started, so it can run on a new pool
+        executor = replace_extraction_executor(executor)
+        future = loop.run_in_executor(executor, extract, path)
+    try:
+        return await future
+    except BrokenProcessPool:
+        # Don't retry: the file itself may be what killed the worker
+        replace_extraction_executor(executor)
+        raise
+
+# Pre-serialized /api/health body, refreshed once a second by refresh_health_body()
+_health_body = {"value": b""}
+
+
+def build_health_body() -> bytes:
+    """Serialize the health check response for the current time"""
+    return orjson.dumps({
+        "status": "healthy",
+        "version": settings.VERSION,
+        "timestamp": datetime.now()
+    })
+
+
+async def refresh_health_body():
+    """Keep the cached health check body current to the second"""
+    while True:
+        _health_body["value"] = build_health_body()
+        await asyncio.sleep(1)
+
+async def prune_image_cache_in_background():
+    """Drop orphaned cached images without holding up startup (the directory only grows)"""
+    try:
+        await asyncio.to_thread(prune_image_cache, IMAGE_OUTPUT_DIR)
+    except OSError as e:
+        logger.warning(f"Image cache pruning failed: {e}")
 
 # Startup and shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    # Sync dependencies (get_current_user) run in anyio's threadpool
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
     logger.info("Initializing database...")
     init_db()
+    # LLM clients are reused across requests
+    app.state.analytics = AnalyticsEngine()
+    # Static mounts go after the API routes; resolved here to keep imports free of disk stats.
+    # The image directory must exist first so /scene_images is mounted on a fresh deploy
+    ensure_output_dir(IMAGE_OUTPUT_DIR)
+    mount_static_dirs(app)
+    health_task = asyncio.create_task(refresh_health_body())
+    prune_task = asyncio.create_task(prune_image_cache_in_background())
     logger.info("Application startup complete")
     yield
     # Shutdown
+    health_task.cancel()
+    prune_task.cancel()
+    EXTRACTION_EXECUTOR.shutdown(wait=False)
     logger.info("Application shutdown")
 
 # Create FastAPI app
@@ -100,6 +205,30 @@ app.add_middleware(
 # Security
 security = HTTPBearer(auto_error=False)
 
+# Short-lived cache of verified tokens: sha256(token) -> user_id
+auth_cache = TTLCache(maxsize=10000, ttl=30)
+
+# Pre-serialized JSON for the public story endpoint, invalidated on writes.
+# Owner-facing reads are not cached: with several uvicorn workers an invalidation
+# only reaches the worker that handled the write, and the frontend re-fetches
+# history/story details right after generating.
+response_cache = TTLCache(maxsize=5000, ttl=10)
+
+
+def cached_json_response(key, build) -> Response:
+    """Serve cached JSON bytes for key, building and caching them on a miss"""
+    body = response_cache.get(key)
+    if body is None:
+        body = orjson.dumps(build())
+        response_cache.set(key, body)
+    return Response(content=body, media_type="application/json")
+
+
+def invalidate_story_cache(story_id: int):
+    """Drop the cached public story view after a write"""
+    response_cache.pop(("story_public", story_id))
+
+
 # Dependency to get current user with JWT
 def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> int:
     """Get current user ID from JWT token"""
@@ -111,48 +240,52 @@ def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depen
         )
     
     token = credentials.credentials
-    user_id = get_user_id_from_token(token)
+    cache_key = hashlib.sha256(token.encode()).digest()
+    cached_user_id = auth_cache.get(cache_key)
+    if cached_user_id is not None:
+        return cached_user_id
+    
+    subject = get_token_subject(token)
     
-    if user_id is None:
+    if subject is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    user_id, token_exp = subject
     
     # Verify user exists
-    user = get_user_by_id(user_id)
-    if not user:
+    if not user_exists(user_id):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Only successful verifications are cached
+    auth_cache.set(cache_key, user_id, expires_at=token_exp)
     return user_id
 
+def get_analytics(request: Request) -> AnalyticsEngine:
+    """Get the shared analytics engine created at startup"""
+    return request.app.state.analytics
+
 # Authentication Endpoints
 @app.post("/api/auth/register", response_model=UserResponse)
 @limiter.limit("10/minute")
 async def register(request: Request, user_data: UserRegister):
     """Register a new user"""
     try:
-        user_id = create_user(user_data.username, user_data.email, user_data.password)
-        if not user_id:
+        user = create_user(user_data.username, user_data.email, user_data.password)
+        if not user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email or username already exists"
             )
         
-        user = get_user_by_email(user_data.email)
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to retrieve user after creation"
-            )
-        
         # Create access token
-        access_token = create_access_token(data={"sub": str(user_id)})
+        access_token = create_access_token(data={"sub": str(user["id"])})
         
         logger.info(f"User registered: {user_data.email}")
         
@@ -223,15 +356,19 @@ async def login(request: Request, credentials: UserLogin):
 # Story Generation Endpoints
 @app.post("/api/generate-scenes", response_model=StoryResponse)
 @limiter.limit("5/minute")
-async def generate_scenes(request: Request, story_input: StoryInput, user_id: int = Depends(get_current_user)):
+async def generate_scenes(
+    request: Request,
+    story_input: StoryInput,
+    user_id: int = Depends(get_current_user),
+    analytics: AnalyticsEngine = Depends(get_analytics)
+):
     """Generate scenes from story prompt"""
     story_id = None
     try:
         # Limit max_scenes to 8
         max_scenes = min(story_input.max_scenes, 8)
         
-        # Initialize generators
-        analytics = AnalyticsEngine()
+        # Initialize per-request memory
         memory = AgentMemory(user_id)
         
         # Get user preferences from memory
@@ -239,42 +376,56 @@ async def generate_scenes(request: Request, story_input: StoryInput, user_id: in
         if preferences.get("preferred_style") and not story_input.style:
             story_input.style = preferences.get("preferred_style")
         
-        # Classify the story
-        classification = analytics.classify(story_input.prompt)
+        # Classify, title and summarize concurrently - the LLM calls are
+        # blocking, so run them in threads to keep the event loop free
+        classification, title, summary = await asyncio.gather(
+            asyncio.to_thread(analytics.classify, story_input.prompt),
+            asyncio.to_thread(analytics.generate_title, story_input.prompt),
+            asyncio.to_thread(analytics.summarize, story_input.prompt, "story"),
+            return_exceptions=True
+        )
+        if isinstance(classification, BaseException):
+            raise classification
         genre = classification.get("genre", "Drama")
         style = story_input.style or preferences.get("preferred_style") or classification.get("style", "Cinematic")
         
         # Initialize scene generator
         scene_gen = SceneGenerator(max_scenes=max_scenes)
         
-        # Generate title from prompt using LLM
-        try:
-            title = analytics.generate_title(story_input.prompt)
-        except Exception as title_error:
+        # Fall back to a title built from the prompt if the LLM call failed
+        if isinstance(title, BaseException):
+            title_error = title
             logger.warning(f"Title generation failed: {title_error}")
-            words = story_input.prompt.split()[:6]
-            title = " ".join(words) + ("..." if len(story_input.prompt.split()) > 6 else "")
+            words = story_input.prompt.split()
+            title = " ".join(words[:6]) + ("..." if len(words) > 6 else "")
             if len(title) > 50:
                 title = title[:47] + "..."
         
         original_title = title
         
         # Create story record FIRST
-        story_id = create_story(user_id, title, story_input.prompt, genre, style, original_title)
+        story = create_story(user_id, title, story_input.prompt, genre, style, original_title)
+        story_id = story["id"]
         
         # Update memory
         memory.story_id = story_id
         memory.add_message("user", story_input.prompt)
         
         # Log agent decision
-        log_agent_decision(story_id, "genre_classification", json.dumps(classification), 0.8)
+        log_agent_decision(story_id, "genre_classification", orjson.dumps(classification).decode(), 0.8)
         
         # Generate scenes
         try:
-            scenes_data = scene_gen.generate_scenes(story_input.prompt)
+            try:
+                scenes_data = await asyncio.wait_for(
+                    asyncio.to_thread(scene_gen.generate_scenes, story_input.prompt),
+                    timeout=SCENE_GENERATION_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                raise Exception(SCENE_TIMEOUT_MESSAGE)
         except Exception as scene_error:
             error_msg = str(scene_error)
-            if any(keyword in error_msg.lower() for keyword in ["quota", "429", "rate limit", "resourceexhausted"]):
+            if RATE_LIMIT_RE.search(error_msg):
                 logger.warning(f"Scene generation failed due to quota: {scene_error}")
                 scenes_data = [{
                     "scene_number": 1,
@@ -285,28 +436,24 @@ async def generate_scenes(request: Request, story_input: StoryInput, user_id: in
                 raise
         
         try:
-            patterns = analytics.detect_patterns(scenes_data)
-            log_agent_decision(story_id, "pattern_detection", json.dumps(patterns), patterns.get("visual_consistency_score", 0.7))
+            patterns = await asyncio.to_thread(analytics.detect_patterns, scenes_data)
+            log_agent_decision(story_id, "pattern_detection", orjson.dumps(patterns).decode(), patterns.get("visual_consistency_score", 0.7))
         except Exception as pattern_error:
             logger.warning(f"Pattern detection failed: {pattern_error}")
         
         try:
-            summary = analytics.summarize(story_input.prompt, "story")
+            if isinstance(summary, BaseException):
+                raise summary
             set_metadata(story_id, "summary", summary)
         except Exception as summary_error:
             logger.warning(f"Summary generation failed: {summary_error}")
             summary = "Story summary unavailable"
         
         # Save scenes to database
+        create_scenes_bulk(story_id, scenes_data)
+        
         scene_outputs = []
         for scene_data in scenes_data:
-            scene_id = create_scene(
-                story_id,
-                scene_data["scene_number"],
-                scene_data["scene_text"],
-                scene_data["cinematic_prompt"]
-            )
-            
             confidence = 0.8
             completeness = min(1.0, len(scene_data["scene_text"]) / 100)
             
@@ -319,13 +466,8 @@ async def generate_scenes(request: Request, story_input: StoryInput, user_id: in
             ))
         
         # Update story status
-        from src.database import get_db_connection
-        conn = get_db_connection()
-        try:
-            conn.execute("UPDATE stories SET status = 'completed' WHERE id = ?", (story_id,))
-            conn.commit()
-        finally:
-            conn.close()
+        update_story_status(story_id, "completed")
+        invalidate_story_cache(story_id)
         
         memory.add_message("assistant", f"Generated {len(scene_outputs)} scenes")
         
@@ -340,7 +482,7 @@ async def generate_scenes(request: Request, story_input: StoryInput, user_id: in
             summary=summary,
             total_scenes=len(scene_outputs),
             status="completed",
-            created_at=datetime.now().isoformat(),
+            created_at=story["created_at"],
             original_title=original_title
         )
     
@@ -348,13 +490,8 @@ async def generate_scenes(request: Request, story_input: StoryInput, user_id: in
         logger.error(f"Error generating scenes: {str(e)}", exc_info=True)
         if story_id:
             try:
-                from src.database import get_db_connection
-                conn = get_db_connection()
-                try:
-                    conn.execute("UPDATE stories SET status = 'failed' WHERE id = ?", (story_id,))
-                    conn.commit()
-                finally:
-                    conn.close()
+                update_story_status(story_id, "failed")
+                invalidate_story_cache(story_id)
             except Exception:
                 pass
         
@@ -366,8 +503,16 @@ async def generate_scenes(request: Request, story_input: StoryInput, user_id: in
 
 @app.post("/api/generate-images/{story_id}")
 @limiter.limit("3/minute")
-async def generate_images(request: Request, story_id: int, user_id: int = Depends(get_current_user)):
-    """Generate images for scenes - handles rate limits gracefully"""
+async def generate_images(
+    request: Request,
+    story_id: int,
+    continuity: bool = True,
+    user_id: int = Depends(get_current_user)
+):
+    """Generate images for scenes - handles rate limits gracefully.
+
+    With continuity=false scenes don't reference each other and are generated concurrently.
+    """
     story = get_story(story_id, user_id)
     if not story:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Story not found")
@@ -382,52 +527,59 @@ async def generate_images(request: Request, story_id: int, user_id: int = Depend
         image_paths = []
         image_urls = []
         failed_scenes = []
+        image_updates = []
         rate_limit_hit = False
+        scene_dicts = [{
+            "scene_number": scene["scene_number"],
+            "scene_text": scene["scene_text"],
+            "cinematic_prompt": scene["cinematic_prompt"]
+        } for scene in scenes]
         
-        for scene in scenes:
+        # Independent scenes are all generated up front, concurrently
+        independent_results = None
+        if not continuity:
+            independent_results = await image_gen.generate_all(scene_dicts)
+        
+        for index, scene in enumerate(scenes):
             try:
-                scene_dict = {
-                    "scene_number": scene["scene_number"],
-                    "scene_text": scene["scene_text"],
-                    "cinematic_prompt": scene["cinematic_prompt"]
-                }
-                
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(image_gen.generate_image_for_scene, scene_dict)
+                if independent_results is None:
+                    # Scenes stay sequential: each image is the continuity
+                    # reference for the next one
                     try:
-                        path = future.result(timeout=300)
-                    except concurrent.futures.TimeoutError:
+                        path = await asyncio.wait_for(
+                            image_gen.generate_image_for_scene(scene_dicts[index]),
+                            timeout=300
+                        )
+                    except asyncio.TimeoutError:
                         raise Exception("Image generation timed out after 5 minutes")
+                else:
+                    path = independent_results[index]
+                    if isinstance(path, BaseException):
+                        raise path
                 
                 image_paths.append(path)
                 filename = os.path.basename(path)
                 image_url = f"/scene_images/{filename}"
                 image_urls.append(image_url)
                 
-                from src.database import get_db_connection
-                conn = get_db_connection()
-                try:
-                    conn.execute("UPDATE scenes SET image_path = ?, image_url = ? WHERE id = ?", 
-                                (path, image_url, scene["id"]))
-                    conn.commit()
-                finally:
-                    conn.close()
+                image_updates.append((path, image_url, scene["id"]))
                 
             except Exception as scene_error:
                 error_msg = str(scene_error)
-                import traceback
-                error_traceback = traceback.format_exc()
                 logger.error(f"Error generating image for scene {scene['scene_number']}: {error_msg}")
-                logger.debug(f"Full traceback: {error_traceback}")
+                # exc_info is only formatted if a DEBUG handler actually emits it
+                logger.debug("Full traceback:", exc_info=True)
                 
                 # Check for specific error types
-                error_lower = error_msg.lower()
-                if any(keyword in error_lower for keyword in ["429", "rate limit", "throttled", "quota", "resourceexhausted"]):
+                if RATE_LIMIT_RE.search(error_msg):
                     rate_limit_hit = True
+                    if independent_results is not None:
+                        # Other scenes already finished - keep collecting them
+                        continue
                     logger.warning("Rate limit detected - stopping image generation")
                     break
-                elif "timeout" in error_lower:
+                error_lower = error_msg.lower()
+                if "timeout" in error_lower:
                     logger.warning(f"Timeout generating image for scene {scene['scene_number']}")
                     failed_scenes.append(scene["scene_number"])
                 elif "no image returned" in error_lower or "runtimeerror" in error_lower:
@@ -438,6 +590,20 @@ async def generate_images(request: Request, story_id: int, user_id: int = Depend
                     failed_scenes.append(scene["scene_number"])
                 continue
         
+        # Scene files are written in the background; make sure they are on disk before
+        # their URLs are stored and returned
+        failed_saves = await image_gen.wait_for_saves()
+        if failed_saves:
+            failed_ids = {scene_id for path, _, scene_id in image_updates if path in failed_saves}
+            failed_scenes.extend(scene["scene_number"] for scene in scenes if scene["id"] in failed_ids)
+            image_updates = [update for update in image_updates if update[0] not in failed_saves]
+            image_paths = [path for path, _, _ in image_updates]
+            image_urls = [image_url for _, image_url, _ in image_updates]
+        
+        # Persist all generated images with a single commit
+        update_scene_images(image_updates)
+        invalidate_story_cache(story_id)
+        
         if rate_limit_hit:
             return {
                 "message": f"Rate limit reached. Generated {len(image_paths)}/{len(scenes)} images. Please wait and try again later.",
@@ -469,7 +635,7 @@ async def generate_images(request: Request, story_id: int, user_id: int = Depend
     except Exception as e:
         logger.error(f"Error generating images: {str(e)}", exc_info=True)
         error_msg = str(e)
-        if any(keyword in error_msg.lower() for keyword in ["429", "rate limit", "throttled"]):
+        if RATE_LIMIT_RE.search(error_msg):
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail="Rate limit reached. Please wait a moment and try again. Your story is saved and you can generate images later."
@@ -511,25 +677,15 @@ class UpdatePasswordRequest(PydanticBaseModel):
 @app.get("/api/history/archived")
 async def get_archived_history(user_id: int = Depends(get_current_user)):
     """Get user's archived story history"""
-    from src.database import get_db_connection
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT * FROM stories WHERE user_id = ? AND archived = 1 ORDER BY created_at DESC",
-            (user_id,)
-        )
-        stories = [dict(row) for row in cursor.fetchall()]
-        return [{
-            "id": s["id"],
-            "title": s["title"],
-            "genre": s["genre"],
-            "style": s["style"],
-            "status": s["status"],
-            "created_at": s["created_at"]
-        } for s in stories]
-    finally:
-        conn.close()
+    stories = get_archived_stories(user_id)
+    return [{
+        "id": s["id"],
+        "title": s["title"],
+        "genre": s["genre"],
+        "style": s["style"],
+        "status": s["status"],
+        "created_at": s["created_at"]
+    } for s in stories]
 
 
 @app.put("/api/user/username")
@@ -538,13 +694,9 @@ async def update_username_endpoint(request: UpdateUsernameRequest, user_id: int
     if not request.username or len(request.username.strip()) < 3:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username must be at least 3 characters")
     
-    success = update_user_username(user_id, request.username.strip())
-    if not success:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists or update failed")
-    
-    user = get_user_by_id(user_id)
+    user = update_user_username(user_id, request.username.strip())
     if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists or update failed")
     
     return UserResponse(
         id=user["id"],
@@ -579,6 +731,7 @@ async def update_story_title_endpoint(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Title is required")
     
     success = update_story(story_id, user_id, request.title.strip())
+    invalidate_story_cache(story_id)
     if not success:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Story not found")
     
@@ -596,6 +749,7 @@ async def delete_story_endpoint(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Story not found")
     
     success = delete_story(story_id, user_id)
+    invalidate_story_cache(story_id)
     if not success:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to delete story")
     
@@ -613,6 +767,7 @@ async def archive_story_endpoint(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Story not found")
     
     success = archive_story(story_id, user_id, archived=True)
+    invalidate_story_cache(story_id)
     if not success:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to archive story")
     
@@ -630,29 +785,17 @@ async def unarchive_story_endpoint(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Story not found")
     
     success = archive_story(story_id, user_id, archived=False)
+    invalidate_story_cache(story_id)
     if not success:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to unarchive story")
     
     return {"message": "Story unarchived successfully", "story_id": story_id}
 
 
-@app.get("/api/story/{story_id}/public")
-async def get_story_public(story_id: int):
-    """Get story details for sharing (public, no auth required)"""
-    from src.database import get_db_connection
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM stories WHERE id = ?", (story_id,))
-        row = cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Story not found")
-        story = dict(row)
-    finally:
-        conn.close()
-    
-    scenes_data = get_story_scenes(story_id)
-    scenes = [SceneOutput(
+def build_story_response(story: dict) -> StoryResponse:
+    """Build a StoryResponse from get_story_with_scenes() output"""
+    # Rows were validated when they were written, so skip re-validation
+    scenes = [SceneOutput.model_construct(
         scene_number=s["scene_number"],
         scene_text=s["scene_text"],
         cinematic_prompt=s["cinematic_prompt"],
@@ -660,23 +803,20 @@ async def get_story_public(story_id: int):
         image_url=s.get("image_url"),
         confidence_score=0.8,
         completeness_score=0.8
-    ) for s in scenes_data]
-    
-    from src.database import get_metadata
-    summary = get_metadata(story_id, "summary")
+    ) for s in story["scenes"]]
     
     original_title = story.get("original_title") or story["title"]
     archived_status = story.get("archived", 0)
     if archived_status is None:
         archived_status = 0
     
-    return StoryResponse(
+    return StoryResponse.model_construct(
         story_id=story["id"],
         title=story["title"],
         genre=story["genre"],
         style=story["style"],
         scenes=scenes,
-        summary=summary,
+        summary=story.get("summary"),
         user_prompt=story.get("user_prompt", ""),
         total_scenes=len(scenes),
         status=story["status"],
@@ -686,54 +826,32 @@ async def get_story_public(story_id: int):
     )
 
 
+@app.get("/api/story/{story_id}/public")
+async def get_story_public(story_id: int):
+    """Get story details for sharing (public, no auth required)"""
+    def build():
+        story = get_story_with_scenes(story_id)
+        if not story:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Story not found")
+        return build_story_response(story).model_dump()
+    
+    return cached_json_response(("story_public", story_id), build)
+
+
 @app.get("/api/story/{story_id}", response_model=StoryResponse)
 async def get_story_details(story_id: int, user_id: int = Depends(get_current_user)):
     """Get full story details (requires authentication)"""
-    story = get_story(story_id, user_id)
+    story = get_story_with_scenes(story_id, user_id)
     if not story:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Story not found")
-    
-    scenes_data = get_story_scenes(story_id)
-    scenes = [SceneOutput(
-        scene_number=s["scene_number"],
-        scene_text=s["scene_text"],
-        cinematic_prompt=s["cinematic_prompt"],
-        image_path=s.get("image_path"),
-        image_url=s.get("image_url"),
-        confidence_score=0.8,
-        completeness_score=0.8
-    ) for s in scenes_data]
-    
-    from src.database import get_metadata
-    summary = get_metadata(story_id, "summary")
-    
-    original_title = story.get("original_title") or story["title"]
-    archived_status = story.get("archived", 0)
-    if archived_status is None:
-        archived_status = 0
-    
-    return StoryResponse(
-        story_id=story["id"],
-        title=story["title"],
-        genre=story["genre"],
-        style=story["style"],
-        scenes=scenes,
-        summary=summary,
-        user_prompt=story.get("user_prompt", ""),
-        total_scenes=len(scenes),
-        status=story["status"],
-        created_at=story["created_at"],
-        original_title=original_title,
-        archived=archived_status
-    )
+    return build_story_response(story)
 
 
 # Query Endpoints
 @app.post("/api/search")
 async def search_stories(query: SearchQuery, user_id: int = Depends(get_current_user)):
     """Search stories by keywords"""
-    stories = get_user_stories(user_id)
-    results = [s for s in stories if query.query.lower() in s["title"].lower() or query.query.lower() in s.get("user_prompt", "").lower()]
+    results = search_user_stories(user_id, query=query.query)
     log_user_query(user_id, query.query, "search", len(results))
     return results
 
@@ -741,34 +859,33 @@ async def search_stories(query: SearchQuery, user_id: int = Depends(get_current_
 @app.post("/api/filter")
 async def filter_stories(filter_query: FilterQuery, user_id: int = Depends(get_current_user)):
     """Filter stories by genre, style, date"""
-    stories = get_user_stories(user_id)
-    results = stories
+    results = search_user_stories(user_id, genre=filter_query.genre, style=filter_query.style)
     
-    if filter_query.genre:
-        results = [s for s in results if s.get("genre") == filter_query.genre]
-    if filter_query.style:
-        results = [s for s in results if s.get("style") == filter_query.style]
-    
-    log_user_query(user_id, json.dumps(filter_query.dict()), "filter", len(results))
+    log_user_query(user_id, orjson.dumps(filter_query.dict()).decode(), "filter", len(results))
     return results
 
 
 @app.post("/api/categorize")
-async def categorize_story(request: CategorizeRequest, user_id: int = Depends(get_current_user)):
+async def categorize_story(
+    request: CategorizeRequest,
+    user_id: int = Depends(get_current_user),
+    analytics: AnalyticsEngine = Depends(get_analytics)
+):
     """Categorize a story"""
-    analytics = AnalyticsEngine()
     classification = analytics.classify(request.story_text)
     log_user_query(user_id, request.story_text, "categorize", 1)
     return classification
 
 
 # File Upload Endpoint
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_EXTRACTED_CHARS = 5000
+
+
 @app.post("/api/upload-file")
 @limiter.limit("10/minute")
 async def upload_file(request: Request, file: UploadFile = File(...), user_id: int = Depends(get_current_user)):
     """Upload and extract text from file (PDF, DOCX, TXT, or Images)"""
-    from pathlib import Path
-    
     # Validate file type
     allowed_extensions = {'.pdf', '.docx', '.txt', '.jpg', '.jpeg', '.png'}
     file_ext = Path(file.filename).suffix.lower() if file.filename else ''
@@ -782,32 +899,59 @@ async def upload_file(request: Request, file: UploadFile = File(...), user_id: i
     extracted_text = ""
     file_type = file_ext[1:] if file_ext else "unknown"
     
+    # PDF/DOCX are spooled to a temp file so a worker process can open them
+    spool = None
     try:
-        contents = await file.read()
+        if file_ext in {'.pdf', '.docx'}:
+            spool = tempfile.NamedTemporaryFile(suffix=file_ext, delete=False)
         
-        # Check file size
-        if len(contents) > settings.MAX_UPLOAD_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File too large. Maximum size: {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
-            )
+        # Stream the upload in chunks, enforcing the size limit as we go
+        text_decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        text_parts = []
+        text_chars = 0  # decoded characters, not counting leading whitespace (stripped below)
+        trailing_space = False
+        total_size = 0
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            total_size += len(chunk)
+            
+            # Check file size
+            if total_size > settings.MAX_UPLOAD_SIZE:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File too large. Maximum size: {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+                )
+            
+            if file_ext == '.txt':
+                # Decode contiguously, but only until we have more text than we return
+                # (past the cap, keep going only while the text could still be stripped)
+                view = memoryview(chunk)
+                while view and (text_chars <= MAX_EXTRACTED_CHARS or trailing_space):
+                    # UTF-8 needs at most 4 bytes per character
+                    step = (MAX_EXTRACTED_CHARS + 1 - text_chars) * 4 if text_chars <= MAX_EXTRACTED_CHARS else len(view)
+                    decoded = text_decoder.decode(view[:step])
+                    view = view[step:]
+                    if decoded:
+                        text_parts.append(decoded)
+                        text_chars += len(decoded) if text_chars else len(decoded.lstrip())
+                        trailing_space = decoded[-1].isspace()
+            elif spool is not None:
+                spool.write(chunk)
         
+        # Text extraction is CPU-bound pure Python; keep it off the event loop
         if file_ext == '.pdf':
-            import PyPDF2
-            from io import BytesIO
-            pdf_file = BytesIO(contents)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            extracted_text = "\n".join([page.extract_text() for page in pdf_reader.pages])
+            spool.close()
+            extracted_text = await run_extraction(extract_pdf_text, spool.name)
             
         elif file_ext == '.docx':
-            from docx import Document
-            from io import BytesIO
-            docx_file = BytesIO(contents)
-            doc = Document(docx_file)
-            extracted_text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+            spool.close()
+            extracted_text = await run_extraction(extract_docx_text, spool.name)
             
         elif file_ext == '.txt':
-            extracted_text = contents.decode('utf-8', errors='ignore')
+            text_parts.append(text_decoder.decode(b'', final=True))
+            extracted_text = "".join(text_parts)
             
         elif file_ext in {'.jpg', '.jpeg', '.png'}:
             extracted_text = f"[Image file: {file.filename}] Image analysis not yet implemented. Please provide a text description."
@@ -820,8 +964,8 @@ async def upload_file(request: Request, file: UploadFile = File(...), user_id: i
                 detail="No text could be extracted from the file. Please ensure the file contains readable text."
             )
         
-        if len(extracted_text) > 5000:
-            extracted_text = extracted_text[:5000] + "... [truncated]"
+        if len(extracted_text) > MAX_EXTRACTED_CHARS:
+            extracted_text = extracted_text[:MAX_EXTRACTED_CHARS] + "... [truncated]"
         
         return {
             "filename": file.filename,
@@ -839,74 +983,64 @@ async def upload_file(request: Request, file: UploadFile = File(...), user_id: i
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing file: {str(e)}"
         )
+    finally:
+        if spool is not None:
+            spool.close()
+            try:
+                os.unlink(spool.name)
+            except OSError:
+                pass
 
 
 # Health Check
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "version": settings.VERSION,
-        "timestamp": datetime.now().isoformat()
-    }
+    return Response(content=_health_body["value"] or build_health_body(), media_type="application/json")
 
 
 # Serve static files (images) - Mount AFTER API routes
 # Use absolute paths to ensure files are found in production
-from pathlib import Path
 BASE_DIR = Path(__file__).parent.parent
 
-if os.path.exists("scene_images") or (BASE_DIR / "scene_images").exists():
-    scene_images_path = "scene_images" if os.path.exists("scene_images") else str(BASE_DIR / "scene_images")
-    app.mount("/scene_images", StaticFiles(directory=scene_images_path), name="scene_images")
-    logger.info(f"Mounted scene_images at: {scene_images_path}")
-
-if os.path.exists("output_scenes") or (BASE_DIR / "output_scenes").exists():
-    output_scenes_path = "output_scenes" if os.path.exists("output_scenes") else str(BASE_DIR / "output_scenes")
-    app.mount("/output_scenes", StaticFiles(directory=output_scenes_path), name="output_scenes")
-    logger.info(f"Mounted output_scenes at: {output_scenes_path}")
-
-# Find suggestion directory - check multiple possible locations
-suggestion_paths = [
-    "suggestion",  # Current directory
-    str(BASE_DIR / "suggestion"),  # Project root
-    "/app/suggestion",  # Railway absolute path
-    os.path.join(os.getcwd(), "suggestion"),  # Current working directory
-]
-
-suggestion_found = None
-for path in suggestion_paths:
-    abs_path = os.path.abspath(path) if not os.path.isabs(path) else path
-    if os.path.exists(abs_path) and os.path.isdir(abs_path):
-        info_json = os.path.join(abs_path, "info.json")
-        if os.path.exists(info_json):
-            suggestion_found = abs_path
-            logger.info(f"Found suggestion directory at: {suggestion_found}")
-            logger.info(f"Verified info.json exists at: {info_json}")
-            break
-    else:
-        logger.debug(f"Suggestion path not found: {abs_path}")
-
-# Fallback: search for suggestion directory
-if not suggestion_found:
-    logger.warning("Suggestion directory not found in expected locations, searching...")
-    for root, dirs, files in os.walk(BASE_DIR):
-        if "suggestion" in dirs:
-            potential_path = os.path.join(root, "suggestion")
-            info_json = os.path.join(potential_path, "info.json")
-            if os.path.exists(info_json):
-                suggestion_found = os.path.abspath(potential_path)
-                logger.info(f"Found suggestion directory via search at: {suggestion_found}")
-                break
 
-if suggestion_found:
-    app.mount("/suggestion", StaticFiles(directory=suggestion_found), name="suggestion")
-    logger.info(f"Mounted suggestion directory at: {suggestion_found}")
-    # Verify info.json exists
-    info_json_path = os.path.join(suggestion_found, "info.json")
-    if os.path.exists(info_json_path):
-        logger.info(f"Found info.json at: {info_json_path}")
+def first_existing_dir(*paths: str, marker: Optional[str] = None) -> Optional[str]:
+    """Return the first directory that exists (and contains marker, if given), stat-ing each candidate once"""
+    for path in paths:
+        target = os.path.join(path, marker) if marker else path
+        if (os.path.isfile if marker else os.path.isdir)(target):
+            return path
+    return None
+
+
+@lru_cache(maxsize=1)
+def resolve_suggestion_dir() -> Optional[str]:
+    """Locate the suggestion directory (checked once, on first call)"""
+    suggestion_paths = [
+        "suggestion",  # Current directory
+        str(BASE_DIR / "suggestion"),  # Project root
+        "/app/suggestion",  # Railway absolute path
+        os.path.join(os.getcwd(), "suggestion"),  # Current working directory
+    ]
+    return first_existing_dir(*[os.path.abspath(path) for path in suggestion_paths], marker="info.json")
+
+
+def mount_static_dirs(app: FastAPI):
+    """Mount image, suggestion and frontend directories (called at startup, not import)"""
+    scene_images_path = first_existing_dir("scene_images", str(BASE_DIR / "scene_images"))
+    if scene_images_path:
+        app.mount("/scene_images", StaticFiles(directory=scene_images_path), name="scene_images")
+        logger.info(f"Mounted scene_images at: {scene_images_path}")
+    
+    output_scenes_path = first_existing_dir("output_scenes", str(BASE_DIR / "output_scenes"))
+    if output_scenes_path:
+        app.mount("/output_scenes", StaticFiles(directory=output_scenes_path), name="output_scenes")
+        logger.info(f"Mounted output_scenes at: {output_scenes_path}")
+    
+    suggestion_found = resolve_suggestion_dir()
+    if suggestion_found:
+        app.mount("/suggestion", StaticFiles(directory=suggestion_found), name="suggestion")
+        logger.info(f"Mounted suggestion directory at: {suggestion_found}")
         # List files in suggestion directory for debugging
         try:
             files = os.listdir(suggestion_found)
@@ -914,19 +1048,11 @@ if suggestion_found:
         except Exception as e:
             logger.warning(f"Could not list suggestion directory: {e}")
     else:
-        logger.error(f"info.json not found at: {info_json_path} even though directory exists!")
-else:
-    logger.warning("Suggestion directory not found in any expected location")
-    # Try to find it anywhere
-    for root, dirs, files in os.walk(BASE_DIR):
-        if "info.json" in files and "suggestion" in root:
-            found_path = os.path.dirname(os.path.join(root, "info.json"))
-            logger.info(f"Found suggestion directory at: {found_path}")
-            app.mount("/suggestion", StaticFiles(directory=found_path), name="suggestion")
-            break
-
-# Serve frontend static files
-if os.path.exists("index.html") or (BASE_DIR / "index.html").exists():
-    static_path = "." if os.path.exists("index.html") else str(BASE_DIR)
-    app.mount("/", StaticFiles(directory=static_path, html=True), name="static")
-    logger.info(f"Mounted static files at: {static_path}")
+        # No recursive search: walking the deployment tree slows every cold start
+        logger.warning("Suggestion directory not found in any expected location")
+    
+    # Serve frontend static files - must stay the last mount since it catches "/"
+    static_path = first_existing_dir(".", str(BASE_DIR), marker="index.html")
+    if static_path:
+        app.mount("/", StaticFiles(directory=static_path, html=True), name="static")
+        logger.info(f"Mounted static files at: {static_path}")
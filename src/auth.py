@@ -2,7 +2,7 @@
 JWT Authentication and Security
 """
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
@@ -44,8 +44,8 @@ def decode_access_token(token: str) -> Optional[dict]:
         return None
 
 
-def get_user_id_from_token(token: str) -> Optional[int]:
-    """Extract user ID from JWT token"""
+def get_token_subject(token: str) -> Optional[Tuple[int, float]]:
+    """Extract user ID and expiry timestamp from JWT token"""
     payload = decode_access_token(token)
     if payload is None:
         return None
@@ -53,7 +53,14 @@ def get_user_id_from_token(token: str) -> Optional[int]:
     if user_id is None:
         return None
     try:
-        return int(user_id)
+        return int(user_id), float(payload.get("exp", 0))
     except (ValueError, TypeError):
         return None
 
+
+def get_user_id_from_token(token: str) -> Optional[int]:
+    """Extract user ID from JWT token"""
+    subject = get_token_subject(token)
+    if subject is None:
+        return None
+    return subject[0]
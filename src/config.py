@@ -2,12 +2,18 @@
 Configuration and Environment Variables
 """
 import os
+import json
+import logging
+import secrets
+from functools import cache
 from typing import List
-from pydantic_settings import BaseSettings
-from pydantic import Field, validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic import Field, field_validator
 
 # Module-level flag to track if SECRET_KEY warning has been shown
 _secret_key_warned = False
+# Set when SECRET_KEY was generated in this process (tokens don't carry over to other processes)
+_secret_key_generated = False
 
 
 class Settings(BaseSettings):
@@ -17,38 +23,44 @@ class Settings(BaseSettings):
     API_V1_PREFIX: str = "/api"
     PROJECT_NAME: str = "Story-to-Scene Generator API"
     VERSION: str = "1.0.0"
-    DEBUG: bool = Field(default=False, env="DEBUG")
+    DEBUG: bool = Field(default=False)
     
     # Server Configuration
-    HOST: str = Field(default="0.0.0.0", env="HOST")
-    PORT: int = Field(default=8000, env="PORT")
+    HOST: str = Field(default="0.0.0.0")
+    PORT: int = Field(default=8000)
+    WORKERS: int = Field(default=1, ge=1)  # see DEPLOYMENT.md for multi-worker sizing
+    THREADPOOL_SIZE: int = Field(default=200)  # sync endpoints/deps run here (anyio default is 40)
+    EXTRACTION_WORKERS: int = Field(default=2, ge=1)  # PDF/DOCX extraction processes per server worker
+    IMG_CONCURRENCY: int = Field(default=4, ge=1)  # parallel Gemini image calls per request (continuity off)
     
     # Security
-    SECRET_KEY: str = Field(default="", env="SECRET_KEY")
+    SECRET_KEY: str = Field(default="", validate_default=True)
     ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=1440, env="ACCESS_TOKEN_EXPIRE_MINUTES")  # 24 hours
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=1440)  # 24 hours
     
     # CORS
-    CORS_ORIGINS: List[str] = Field(default=["*"], env="CORS_ORIGINS")
+    CORS_ORIGINS: List[str] = Field(default=["*"])
     
     # Database
-    DATABASE_URL: str = Field(default="sqlite:///./database/story_scenes.db", env="DATABASE_URL")
+    DATABASE_URL: str = Field(default="sqlite:///./database/story_scenes.db")
     
     # Google API
-    GOOGLE_API_KEY: str = Field(..., env="GOOGLE_API_KEY")
+    GOOGLE_API_KEY: str = Field(...)
     
     # File Upload
-    MAX_UPLOAD_SIZE: int = Field(default=10485760, env="MAX_UPLOAD_SIZE")  # 10MB
-    UPLOAD_DIR: str = Field(default="uploads", env="UPLOAD_DIR")
+    MAX_UPLOAD_SIZE: int = Field(default=10485760)  # 10MB
+    UPLOAD_DIR: str = Field(default="uploads")
     
     # Rate Limiting
-    RATE_LIMIT_ENABLED: bool = Field(default=True, env="RATE_LIMIT_ENABLED")
-    RATE_LIMIT_PER_MINUTE: int = Field(default=60, env="RATE_LIMIT_PER_MINUTE")
+    RATE_LIMIT_ENABLED: bool = Field(default=True)
+    RATE_LIMIT_PER_MINUTE: int = Field(default=60)
+    RATE_LIMIT_STORAGE_URI: str = Field(default="memory://")  # e.g. redis://host:6379 for multi-worker
     
     # Logging
-    LOG_LEVEL: str = Field(default="INFO", env="LOG_LEVEL")
+    LOG_LEVEL: str = Field(default="INFO")
     
-    @validator("CORS_ORIGINS", pre=True)
+    @field_validator("CORS_ORIGINS", mode="before")
+    @classmethod
     def parse_cors_origins(cls, v):
         if v is None:
             return ["*"]
@@ -57,7 +69,6 @@ class Settings(BaseSettings):
                 return ["*"]
             # Handle JSON array string like '["http://localhost:8080","https://example.com"]'
             if v.startswith("[") and v.endswith("]"):
-                import json
                 try:
                     parsed = json.loads(v)
                     if isinstance(parsed, list):
@@ -70,16 +81,14 @@ class Settings(BaseSettings):
             return v
         return ["*"]
     
-    @validator("SECRET_KEY", pre=True, always=True)
+    @field_validator("SECRET_KEY", mode="before")
+    @classmethod
     def validate_secret_key(cls, v):
-        global _secret_key_warned
+        global _secret_key_warned, _secret_key_generated
         if not v or len(v) < 32:
             # Generate a random secret key if not provided (WARNING: This will invalidate tokens on restart!)
-            import secrets
-            import logging
-            import sys
-            
             generated_key = secrets.token_urlsafe(32)
+            _secret_key_generated = True
             
             # Only log warning once per process (use module-level flag)
             if not _secret_key_warned:
@@ -104,12 +113,26 @@ class Settings(BaseSettings):
             return generated_key
         return v
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = True
+    # Frozen: settings are read-only after startup
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        case_sensitive=True,
+        frozen=True,
+    )
+
+
+def secret_key_generated() -> bool:
+    """Whether SECRET_KEY was auto-generated for this process"""
+    return _secret_key_generated
+
+
+@cache
+def get_settings() -> Settings:
+    """Load and validate settings once per process"""
+    return Settings()
 
 
 # Global settings instance
-settings = Settings()
+settings = get_settings()
 
@@ -3,7 +3,8 @@ Database Operations using SQLAlchemy
 """
 import sqlite3
 import os
-from typing import Optional, List, Dict
+import queue
+from typing import Optional, List, Dict, Tuple
 from pathlib import Path
 
 # Use absolute path and ensure database directory exists
@@ -34,14 +35,41 @@ except ImportError:
     DATABASE_PATH = str(DATABASE_DIR / "story_scenes.db")
 
 
+# Connection pool: close() hands a connection back instead of tearing it down
+POOL_SIZE = 20
+_pool: "queue.LifoQueue[PooledConnection]" = queue.LifoQueue(maxsize=POOL_SIZE)
+
+
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection that returns itself to the pool on close()"""
+
+    def close(self):
+        try:
+            if self.in_transaction:
+                self.rollback()
+            _pool.put_nowait(self)
+        except (queue.Full, sqlite3.Error):
+            super().close()
+
+
 def get_db_connection():
-    """Get SQLite database connection"""
-    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
-    conn = sqlite3.connect(DATABASE_PATH)
+    """Get SQLite database connection from the pool"""
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        pass
+    os.makedirs(os.path.dirname(DATABASE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(DATABASE_PATH, factory=PooledConnection, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    # SQLite's LOWER() only folds ASCII; use Python's Unicode-aware lower() for search
+    conn.create_function("PY_LOWER", 1, _py_lower, deterministic=True)
     return conn
 
 
+def _py_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
 def init_db():
     """Initialize database with schema"""
     schema_path = os.path.join(os.path.dirname(__file__), '..', 'database', 'schema.sql')
@@ -86,6 +114,13 @@ def init_db():
         except sqlite3.OperationalError as e:
             print(f"Error adding archived column: {e}")
     
+    # Covering index for history/search queries (needs the archived column above)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_stories_user_archived_created "
+        "ON stories(user_id, archived, created_at DESC)"
+    )
+    conn.commit()
+    
     conn.close()
     print("Database initialized successfully")
 
@@ -94,19 +129,20 @@ def hash_password(password: str) -> str:
     from src.auth import get_password_hash
     return get_password_hash(password)
 
-def create_user(username: str, email: str, password: str) -> Optional[int]:
-    """Create a new user"""
+def create_user(username: str, email: str, password: str) -> Optional[Dict]:
+    """Create a new user and return the inserted row"""
     conn = get_db_connection()
     try:
         password_hash = hash_password(password)
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+            """INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)
+               RETURNING id, username, email, plan, created_at""",
             (username, email, password_hash)
         )
-        user_id = cursor.lastrowid
+        row = cursor.fetchone()
         conn.commit()
-        return user_id
+        return dict(row) if row else None
     except sqlite3.IntegrityError:
         return None
     finally:
@@ -140,25 +176,38 @@ def get_user_by_id(user_id: int) -> Optional[Dict]:
         conn.close()
 
 
+def user_exists(user_id: int) -> bool:
+    """Check whether a user ID exists without loading the row"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM users WHERE id = ? LIMIT 1", (user_id,))
+        return cursor.fetchone() is not None
+    finally:
+        conn.close()
+
+
 def verify_password(password: str, password_hash: str) -> bool:
     """Verify password against hash"""
     from src.auth import verify_password as verify_pwd
     return verify_pwd(password, password_hash)
 
-def update_user_username(user_id: int, new_username: str) -> bool:
-    """Update user's username"""
+def update_user_username(user_id: int, new_username: str) -> Optional[Dict]:
+    """Update user's username and return the updated row"""
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
         cursor.execute(
-            "UPDATE users SET username = ? WHERE id = ?",
+            """UPDATE users SET username = ? WHERE id = ?
+               RETURNING id, username, email, plan, created_at""",
             (new_username.strip(), user_id)
         )
+        row = cursor.fetchone()
         conn.commit()
-        return cursor.rowcount > 0
+        return dict(row) if row else None
     except sqlite3.IntegrityError:
         # Username already exists
-        return False
+        return None
     finally:
         conn.close()
 
@@ -181,20 +230,21 @@ def update_user_password(user_id: int, new_password: str) -> bool:
         conn.close()
 
 # Story Operations
-def create_story(user_id: int, title: str, user_prompt: str, genre: Optional[str] = None, style: Optional[str] = None, original_title: Optional[str] = None) -> int:
-    """Create a new story"""
+def create_story(user_id: int, title: str, user_prompt: str, genre: Optional[str] = None, style: Optional[str] = None, original_title: Optional[str] = None) -> Dict:
+    """Create a new story and return its id and created_at"""
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
         # If original_title not provided, use title as original_title
         original_title = original_title or title
         cursor.execute(
-            "INSERT INTO stories (user_id, title, original_title, user_prompt, genre, style) VALUES (?, ?, ?, ?, ?, ?)",
+            """INSERT INTO stories (user_id, title, original_title, user_prompt, genre, style) VALUES (?, ?, ?, ?, ?, ?)
+               RETURNING id, created_at""",
             (user_id, title, original_title, user_prompt, genre, style)
         )
-        story_id = cursor.lastrowid
+        story = dict(cursor.fetchone())
         conn.commit()
-        return story_id
+        return story
     finally:
         conn.close()
 
@@ -230,6 +280,57 @@ def get_user_stories(user_id: int, limit: int = 50, include_archived: bool = Fal
     finally:
         conn.close()
 
+def search_user_stories(user_id: int, query: Optional[str] = None, genre: Optional[str] = None,
+                        style: Optional[str] = None, limit: int = 50) -> List[Dict]:
+    """Search a user's (non-archived) stories by keyword, genre and style in SQL"""
+    sql = "SELECT * FROM stories WHERE user_id = ? AND (archived = 0 OR archived IS NULL)"
+    params: list = [user_id]
+    if query:
+        # Escape LIKE wildcards so the query is matched literally
+        pattern = "%" + query.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        sql += " AND (PY_LOWER(title) LIKE ? ESCAPE '\\' OR PY_LOWER(user_prompt) LIKE ? ESCAPE '\\')"
+        params.extend([pattern, pattern])
+    if genre:
+        sql += " AND genre = ?"
+        params.append(genre)
+    if style:
+        sql += " AND style = ?"
+        params.append(style)
+    sql += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+    
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def update_story_status(story_id: int, status: str) -> bool:
+    """Update story generation status"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE stories SET status = ? WHERE id = ?", (status, story_id))
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+def get_archived_stories(user_id: int) -> List[Dict]:
+    """Get all archived stories for a user"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT * FROM stories WHERE user_id = ? AND archived = 1 ORDER BY created_at DESC",
+            (user_id,)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
 def update_story(story_id: int, user_id: int, title: Optional[str] = None) -> bool:
     """Update story title"""
     conn = get_db_connection()
@@ -291,6 +392,78 @@ def create_scene(story_id: int, scene_number: int, scene_text: str, cinematic_pr
     finally:
         conn.close()
 
+def create_scenes_bulk(story_id: int, scenes: List[Dict]) -> int:
+    """Create all scenes for a story in a single transaction"""
+    rows = [
+        (story_id, s["scene_number"], s["scene_text"], s["cinematic_prompt"],
+         s.get("image_path"), s.get("image_url"))
+        for s in scenes
+    ]
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.executemany(
+            """INSERT INTO scenes (story_id, scene_number, scene_text, cinematic_prompt, image_path, image_url)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            rows
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+def get_story_with_scenes(story_id: int, user_id: Optional[int] = None) -> Optional[Dict]:
+    """Get a story with its scenes and summary in one query (user-specific if user_id given)"""
+    sql = """
+        SELECT st.*,
+               (SELECT value FROM metadata WHERE story_id = st.id AND key = 'summary') AS summary,
+               sc.id AS scene_id, sc.scene_number, sc.scene_text, sc.cinematic_prompt,
+               sc.image_path, sc.image_url
+        FROM stories st
+        LEFT JOIN scenes sc ON sc.story_id = st.id
+        WHERE st.id = ?"""
+    params: list = [story_id]
+    if user_id is not None:
+        sql += " AND st.user_id = ?"
+        params.append(user_id)
+    sql += " ORDER BY sc.scene_number"
+    
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        scene_keys = ("scene_number", "scene_text", "cinematic_prompt", "image_path", "image_url")
+        # Every row repeats the story columns; strip the per-scene ones off
+        story = dict(rows[0])
+        for key in ("scene_id",) + scene_keys:
+            story.pop(key, None)
+        story["scenes"] = [
+            {key: row[key] for key in scene_keys}
+            for row in rows if row["scene_id"] is not None
+        ]
+        return story
+    finally:
+        conn.close()
+
+def update_scene_images(updates: List[Tuple[str, str, int]]) -> int:
+    """Attach generated images to scenes in one transaction; updates are (image_path, image_url, scene_id)"""
+    if not updates:
+        return 0
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "UPDATE scenes SET image_path = ?, image_url = ? WHERE id = ?",
+            updates
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
 def get_story_scenes(story_id: int) -> List[Dict]:
     """Get all scenes for a story"""
     conn = get_db_connection()
@@ -0,0 +1,16 @@
+"""
+Shared Gemini Client
+"""
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv
+from google import genai
+
+load_dotenv()
+
+
+@lru_cache(maxsize=1)
+def get_client() -> genai.Client:
+    """Return the process-wide genai client (one HTTP connection pool for every caller)"""
+    return genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
@@ -1,28 +1,105 @@
 import os
-import threading
-import queue
+import time
+import uuid
+import random
+import shutil
+import asyncio
+import hashlib
 import logging
-from typing import List, Dict, Union
+import threading
+from typing import List, Dict, Tuple, Union
 from io import BytesIO
+from pathlib import Path
 
-from dotenv import load_dotenv
 from PIL import Image
-from google import genai
-from google.genai import types
-
-logger = logging.getLogger(__name__)
-
-load_dotenv()
+from google.genai import errors, types
 
-google_api_key = os.getenv("GOOGLE_API_KEY")
+from src.config import settings
+from src.genai_client import get_client
 
-genai_client = genai.Client(api_key=google_api_key)
+logger = logging.getLogger(__name__)
 
 OUTPUT_DIR = "scene_images"
 IMAGE_EXT = "png"
 IMAGE_GENERATION_MODEL = "gemini-2.5-flash-image"
+IMAGE_GENERATION_TIMEOUT = 120  # seconds
+
+# Retries for 429 / 5xx responses, with full-jitter exponential backoff
+IMAGE_GENERATION_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1  # seconds
+RETRY_MAX_DELAY = 30  # seconds
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+WRITE_BUFFER_SIZE = 64 * 1024  # coalesces Pillow's small PNG chunk writes
+
+# Continuity reference sent with each follow-up scene
+REFERENCE_MAX_SIZE = 768  # longest side, px
+REFERENCE_MIME_TYPE = "image/webp"
+REFERENCE_WEBP_QUALITY = 75
+
+# Upper bound on in-flight Gemini calls when scenes are generated independently
+MAX_CONCURRENT_SCENES = settings.IMG_CONCURRENCY
+
+# Content-addressed image cache, stored next to the scene files as hard links
+CACHE_PREFIX = "cache_"
+TMP_SUFFIX = ".tmp"
+STALE_TMP_AGE = 3600  # seconds before an abandoned temp file is pruned
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# Output directories already created by this process
+_created_dirs: set[str] = set()
+_created_dirs_lock = threading.Lock()
+
+# Pre-formatted style prompts, keyed by lowercased style name
+STYLE_PROMPTS = {
+    key: f"Style: {description}"
+    for key, description in {
+        "cinematic": "Cinematic film photography, dramatic lighting, professional cinematography.",
+        "anime": "Anime art style, vibrant colors, Japanese animation aesthetic.",
+        "watercolor": "Watercolor painting, soft brush strokes.",
+        "noir": "Film noir, high contrast black and white, dramatic shadows.",
+        "cyberpunk": "Cyberpunk aesthetic, neon lights, futuristic city.",
+    }.items()
+}
+
+def ensure_output_dir(path: str):
+    """Create an output directory on first use (once per path per process)"""
+    if path in _created_dirs:
+        return
+    with _created_dirs_lock:
+        if path not in _created_dirs:
+            os.makedirs(path, exist_ok=True)
+            _created_dirs.add(path)
+
+def link_into_cache(file_path: str, cache_path: str):
+    """Atomically publish file_path as cache_path, sharing its storage via a hard link"""
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}{TMP_SUFFIX}"
+    try:
+        os.link(file_path, tmp_path)
+    except OSError:
+        # Filesystem without hard links
+        shutil.copyfile(file_path, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+def prune_image_cache(output_dir: str = OUTPUT_DIR) -> int:
+    """Delete cached images no scene file links to any more, plus abandoned temp files"""
+    removed = 0
+    stale_before = time.time() - STALE_TMP_AGE
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(TMP_SUFFIX):
+                    stale = stat.st_mtime < stale_before
+                else:
+                    stale = entry.name.startswith(CACHE_PREFIX) and stat.st_nlink == 1
+                if stale:
+                    os.unlink(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    if removed:
+        logger.info(f"Pruned {removed} unused cached image files from {output_dir}")
+    return removed
 
 class ImageGenerator:
     def __init__(
@@ -32,39 +109,70 @@ class ImageGenerator:
         style: str = "Cinematic",
     ):
         self.output_dir = output_dir
+        ensure_output_dir(output_dir)
         self.story_id = story_id
         self.style = style
         self.aspect_ratio = "3:4"
+        self._style_prompt = STYLE_PROMPTS.get(style.lower(), f"Style: {style}")
+        self._filename_prefix = os.path.join(output_dir, f"scene_{story_id}_" if story_id else "scene_")
+        self._config = types.GenerateContentConfig(
+            response_modalities=["IMAGE"],
+            image_config=types.ImageConfig(aspect_ratio=self.aspect_ratio),
+        )
 
         # ALWAYS real Pillow image
         self.previous_image: Image.Image | None = None
+        # WebP encoding of previous_image, sent as the continuity reference
+        self._previous_image_reference: bytes | None = None
+        # Raw bytes of the last generated image, decoded lazily into the two above
+        self._previous_image_bytes: bytes | None = None
+        # Disk writes still running in the background (see wait_for_saves)
+        self._pending_saves: Dict[str, asyncio.Future] = {}
+
+    async def generate_all(self, scenes: List[Dict]) -> List[Union[str, BaseException]]:
+        """Generate every scene without continuity, returning the file path or the raised exception per scene.
+
+        Scenes run concurrently (bounded by MAX_CONCURRENT_SCENES). With continuity each
+        image is the reference for the next, so callers loop over generate_image_for_scene.
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_SCENES)
 
-    def _get_style_prompt(self) -> str:
-        styles = {
-            "cinematic": "Cinematic film photography, dramatic lighting, professional cinematography.",
-            "anime": "Anime art style, vibrant colors, Japanese animation aesthetic.",
-            "watercolor": "Watercolor painting, soft brush strokes.",
-            "noir": "Film noir, high contrast black and white, dramatic shadows.",
-            "cyberpunk": "Cyberpunk aesthetic, neon lights, futuristic city.",
-        }
-        return f"Style: {styles.get(self.style.lower(), self.style)}"
-
-    def generate_image_for_scene(self, scene: Dict) -> str:
+        async def generate_one(scene: Dict) -> str:
+            async with semaphore:
+                return await self.generate_image_for_scene(scene, continuity=False)
+
+        results = await asyncio.gather(*[generate_one(scene) for scene in scenes], return_exceptions=True)
+        failed_saves = await self.wait_for_saves()
+        return [failed_saves.get(result, result) if isinstance(result, str) else result for result in results]
+
+    async def wait_for_saves(self) -> Dict[str, BaseException]:
+        """Wait until every scene image handed to _store_image is on disk, returning the paths that failed to save"""
+        saves, self._pending_saves = self._pending_saves, {}
+        results = await asyncio.gather(*saves.values(), return_exceptions=True)
+        failed = {}
+        for file_path, result in zip(saves, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to save scene image {file_path}: {result}")
+                failed[file_path] = result
+        return failed
+
+    async def generate_image_for_scene(self, scene: Dict, continuity: bool = True) -> str:
         prompt = scene.get("cinematic_prompt") or scene.get("scene_text", "")
         if not prompt.strip():
             raise ValueError("Empty scene prompt")
 
         contents: List[Union[str, types.Part]] = []
 
-        if self.previous_image:
-            buffer = BytesIO()
-            self.previous_image.save(buffer, format="JPEG")
-            buffer.seek(0)
+        if continuity and self._previous_image_bytes and self._previous_image_reference is None:
+            self.previous_image, self._previous_image_reference = await asyncio.to_thread(
+                self._encode_reference, self._previous_image_bytes
+            )
 
+        if continuity and self._previous_image_reference:
             contents.append(
                 types.Part.from_bytes(
-                    data=buffer.read(),
-                    mime_type="image/jpeg",
+                    data=self._previous_image_reference,
+                    mime_type=REFERENCE_MIME_TYPE,
                 )
             )
 
@@ -73,85 +181,77 @@ class ImageGenerator:
                 "Characters, faces, clothing, lighting, and environment must remain consistent."
             )
 
-        contents.append(f"{self._get_style_prompt()}\n{prompt}")
+        contents.append(f"{self._style_prompt}\n{prompt}")
 
         scene_number = scene.get("scene_number", 1)
-        filename = (
-            f"scene_{self.story_id}_{scene_number:02d}.{IMAGE_EXT}"
-            if self.story_id
-            else f"scene_{scene_number:02d}.{IMAGE_EXT}"
-        )
-        file_path = os.path.join(self.output_dir, filename)
+        file_path = f"{self._filename_prefix}{scene_number:02d}.{IMAGE_EXT}"
 
-        return self._generate_image(contents, file_path)
+        # Identical requests (same model, style, prompt and reference) reuse the earlier image
+        cache_path = os.path.join(self.output_dir, f"{CACHE_PREFIX}{self._cache_key(contents)}.{IMAGE_EXT}")
+        if os.path.exists(cache_path):
+            try:
+                img_bytes = await asyncio.to_thread(Path(cache_path).read_bytes)
+            except FileNotFoundError:
+                pass  # pruned in the meantime - generate it again
+            else:
+                logger.info(f"Reusing cached image {cache_path} for {file_path}")
+                return await self._store_image(img_bytes, file_path, continuity, cache_path)
+
+        return await self._generate_image(contents, file_path, continuity, cache_path)
 
-    def _generate_image(self, contents, file_path) -> str:
-        result_q = queue.Queue()
-        error_q = queue.Queue()
+    def _cache_key(self, contents: List[Union[str, types.Part]]) -> str:
+        """Hash every input that determines the generated image"""
+        digest = hashlib.blake2b(f"{IMAGE_GENERATION_MODEL}|{self.aspect_ratio}".encode(), digest_size=16)
+        for item in contents:
+            digest.update(b"\0")
+            digest.update(item.encode() if isinstance(item, str) else item.inline_data.data)
+        return digest.hexdigest()
 
-        def worker():
+    async def _call_api(self, contents) -> types.GenerateContentResponse:
+        """Call Gemini, retrying rate-limit and server errors with backoff"""
+        for attempt in range(IMAGE_GENERATION_ATTEMPTS):
             try:
-                # Check if ImageConfig exists in types
-                has_image_config = hasattr(types, 'ImageConfig')
-                
-                if has_image_config:
-                    # Use ImageConfig if available (newer API)
-                    config = types.GenerateContentConfig(
-                        response_modalities=["IMAGE"],
-                        image_config=types.ImageConfig(aspect_ratio=self.aspect_ratio),
-                    )
-                else:
-                    # Fallback: Create config without ImageConfig (older API or different structure)
-                    config = types.GenerateContentConfig(
-                        response_modalities=["IMAGE"],
-                    )
-                    # Try to set aspect ratio if the config supports it
-                    try:
-                        if hasattr(config, 'image_config'):
-                            # If image_config attribute exists, try to set it
-                            config.image_config = {"aspect_ratio": self.aspect_ratio}
-                    except (AttributeError, TypeError):
-                        # If setting fails, continue without aspect ratio
-                        pass
-
-                response = genai_client.models.generate_content(
-                    model=IMAGE_GENERATION_MODEL,
-                    contents=contents,
-                    config=config,
+                return await asyncio.wait_for(
+                    get_client().aio.models.generate_content(
+                        model=IMAGE_GENERATION_MODEL,
+                        contents=contents,
+                        config=self._config,
+                    ),
+                    timeout=IMAGE_GENERATION_TIMEOUT,
                 )
-                result_q.put(response)
+            except asyncio.TimeoutError:
+                raise TimeoutError("Image generation timeout")
+            except errors.APIError as e:
+                retryable = e.code == 429 or (e.code or 0) >= 500
+                if not retryable or attempt == IMAGE_GENERATION_ATTEMPTS - 1:
+                    logger.error(f"Image generation error ({type(e).__name__}): {e}", exc_info=True)
+                    raise
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+                logger.warning(f"Image generation failed with {e.code}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
             except Exception as e:
-                import traceback
-                error_details = {
-                    "error": str(e),
-                    "error_type": type(e).__name__,
-                    "traceback": traceback.format_exc()
-                }
-                error_q.put((e, error_details))
-
-        t = threading.Thread(target=worker, daemon=True)
-        t.start()
-        t.join(timeout=120)
-
-        if t.is_alive():
-            raise TimeoutError("Image generation timeout")
-
-        if not error_q.empty():
-            error_data = error_q.get()
-            if isinstance(error_data, tuple):
-                error, error_details = error_data
-                print(f"Image generation error: {error_details['error']}")
-                print(f"Error type: {error_details['error_type']}")
-                raise error
-            else:
-                raise error_data
+                logger.error(f"Image generation error ({type(e).__name__}): {e}", exc_info=True)
+                raise
 
-        response = result_q.get()
+    async def _generate_image(self, contents, file_path, continuity: bool = True, cache_path: str | None = None) -> str:
+        response = await self._call_api(contents)
 
-        pil_image = None
+        # Fast path: the image is the first part of the first candidate
+        try:
+            img_bytes = response.candidates[0].content.parts[0].inline_data.data
+        except (IndexError, AttributeError, TypeError):
+            img_bytes = None
+        if not img_bytes:
+            img_bytes = self._extract_image_bytes(response)
 
+        return await self._store_image(img_bytes, file_path, continuity, cache_path)
+
+    @staticmethod
+    def _extract_image_bytes(response: types.GenerateContentResponse) -> bytes:
+        """Scan every response part for image data, logging why none was found"""
+        parts = response.parts
         # Check if response has parts and it's not None
-        if response.parts is None:
+        if parts is None:
             # Log response details for debugging
             finish_reason = getattr(response, 'finish_reason', None)
             candidates = getattr(response, 'candidates', None)
@@ -159,27 +259,22 @@ class ImageGenerator:
             raise RuntimeError(f"API response has no parts (finish_reason: {finish_reason})")
         
         # Check if parts is iterable and not empty
-        if not response.parts:
+        if not parts:
             finish_reason = getattr(response, 'finish_reason', None)
             logger.warning(f"API response returned empty parts list (finish_reason: {finish_reason})")
             raise RuntimeError(f"API response returned empty parts list (finish_reason: {finish_reason})")
 
-        # Iterate through parts to find image data
-        parts_checked = 0
-        for part in response.parts:
-            parts_checked += 1
-            if part and hasattr(part, 'inline_data') and part.inline_data:
-                img_bytes = part.inline_data.data
-                if img_bytes:
-                    pil_image = Image.open(BytesIO(img_bytes)).convert("RGB")
-                    logger.debug(f"Successfully extracted image from part {parts_checked}")
-                    break
-
-        if pil_image is None:
+        # First part carrying image data
+        img_bytes = next(
+            (part.inline_data.data for part in parts if part and part.inline_data and part.inline_data.data),
+            None,
+        )
+
+        if not img_bytes:
             # Log more details about the response for debugging
             finish_reason = getattr(response, 'finish_reason', None)
             candidates = getattr(response, 'candidates', None)
-            parts_count = len(response.parts) if response.parts else 0
+            parts_count = len(parts) if parts else 0
             logger.error(
                 f"No image found in response. "
                 f"parts_count={parts_count}, "
@@ -189,8 +284,62 @@ class ImageGenerator:
             error_msg = f"No image returned from API (checked {parts_count} parts, finish_reason: {finish_reason})"
             raise RuntimeError(error_msg)
 
-        pil_image.save(file_path)
-        self.previous_image = pil_image
+        return img_bytes
+
+    async def _store_image(
+        self, img_bytes: bytes, file_path: str, continuity: bool = True, cache_path: str | None = None
+    ) -> str:
+        # Disk write runs in the threadpool, overlapping the next scene's API call
+        self._pending_saves[file_path] = asyncio.ensure_future(
+            asyncio.to_thread(self._save_image, img_bytes, file_path, cache_path)
+        )
+        if continuity:
+            # Decoded and re-encoded only if another scene actually uses it as a reference
+            self._previous_image_bytes = img_bytes
+            self.previous_image = self._previous_image_reference = None
+
+        return file_path
+
+    @staticmethod
+    def _save_image(img_bytes: bytes, file_path: str, cache_path: str | None = None):
+        """Write the scene image to disk as PNG (and link it into the cache, if given)"""
+        # Write a temp file and rename it into place: readers never see a partial
+        # image, and cache links to the previous file_path keep their contents
+        tmp_path = f"{file_path}.{uuid.uuid4().hex}{TMP_SUFFIX}"
+        try:
+            if img_bytes.startswith(PNG_SIGNATURE):
+                # Already PNG - write the API bytes as-is instead of re-encoding
+                # (a single write larger than the buffer goes straight to the OS)
+                with open(tmp_path, "wb") as f:
+                    f.write(img_bytes)
+            else:
+                pil_image = Image.open(BytesIO(img_bytes))
+                with open(tmp_path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+                    pil_image.save(f, format="PNG")
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
 
-        print(f"Saved {file_path} ({os.path.getsize(file_path)} bytes)")
-        return file_path
\ No newline at end of file
+        if cache_path:
+            link_into_cache(file_path, cache_path)
+        logger.info(f"Saved {file_path} ({len(img_bytes)} bytes)")
+
+    @staticmethod
+    def _encode_reference(img_bytes: bytes) -> Tuple[Image.Image, bytes]:
+        """Decode the previous scene image and return it plus its WebP encoding for the next scene"""
+        pil_image = Image.open(BytesIO(img_bytes))
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        # The reference only carries continuity cues, so send a small, cheap WebP
+        reference = pil_image.copy()
+        reference.thumbnail((REFERENCE_MAX_SIZE, REFERENCE_MAX_SIZE), Image.BILINEAR)
+        buffer = BytesIO()
+        reference.save(
+            buffer,
+            format="WEBP",
+            quality=REFERENCE_WEBP_QUALITY,
+            method=0,  # fastest encoder preset; higher methods barely shrink the output
+        )
+        return pil_image, buffer.getvalue()
@@ -1,18 +1,20 @@
 import os
-import json
 import re
+import orjson
 from typing import List, Dict
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
-import threading
-import queue
 
 load_dotenv()
 
 OUTPUT_DIR = "output_scenes"
 SCENES_FILE = "scenes.json"
 MAX_SCENES = 8
+RATE_LIMIT_RE = re.compile(r"429|quota|rate limit|resourceexhausted", re.IGNORECASE)
+SCENE_GENERATION_TIMEOUT = 30  # seconds
+TIMEOUT_RE = re.compile(r"timed? ?out|deadline", re.IGNORECASE)
+SCENE_TIMEOUT_MESSAGE = f"Scene generation timed out after {SCENE_GENERATION_TIMEOUT} seconds. API quota may be exceeded."
 
 def ensure_output_dir(path: str):
     os.makedirs(path, exist_ok=True)
@@ -30,7 +32,6 @@ class SceneGenerator:
     def __init__(self, model_name: str = "gemini-2.5-flash", max_scenes: int = MAX_SCENES):
         # Configure LLM with no retries on rate limits - stop immediately on 429 errors
         # max_retries=0 means no automatic retries, but langchain still retries internally
-        # We'll handle timeouts manually to prevent infinite retries
         self.llm = ChatGoogleGenerativeAI(
             model=model_name,
             max_retries=0,  # Disable automatic retries
@@ -54,52 +55,29 @@ class SceneGenerator:
     def generate_scenes(self, story: str) -> List[Dict]:
         prompt = self.template.format(story=story, max_scenes=self.max_scenes)
 
-        # Use threading with timeout to prevent infinite retries on rate limits
-        result_queue = queue.Queue()
-        exception_queue = queue.Queue()
-        max_wait_time = 30  # 30 second timeout for scene generation
-        
-        def run_llm():
-            try:
-                response_text = self.llm.predict(prompt)
-                result_queue.put(response_text)
-            except Exception as e:
-                exception_queue.put(e)
-        
-        # Start LLM call in a thread
-        thread = threading.Thread(target=run_llm, daemon=True)
-        thread.start()
-        thread.join(timeout=max_wait_time)
-        
-        # Check if thread is still running (timeout occurred)
-        if thread.is_alive():
-            raise Exception(f"Scene generation timed out after {max_wait_time} seconds. API quota may be exceeded.")
-        
-        # Check for exceptions
-        if not exception_queue.empty():
-            e = exception_queue.get()
+        try:
+            # The chat model ignores its own timeout field; a per-call timeout is passed
+            # through to the Gemini client so each attempt gets a deadline
+            response_text = self.llm.predict(prompt, timeout=SCENE_GENERATION_TIMEOUT)
+        except Exception as e:
             error_msg = str(e)
             # Check for rate limit/quota errors
-            if "429" in error_msg or "quota" in error_msg.lower() or "rate limit" in error_msg.lower() or "ResourceExhausted" in error_msg:
+            if RATE_LIMIT_RE.search(error_msg):
                 raise Exception(f"API quota exceeded: {error_msg}")
-            raise e
-        
-        # Get result
-        if result_queue.empty():
-            raise Exception("Scene generation failed - no result returned")
-        
-        response_text = result_queue.get()
+            if TIMEOUT_RE.search(error_msg):
+                raise Exception(SCENE_TIMEOUT_MESSAGE)
+            raise
         
         # Clean the response
         response_text = clean_json_response(response_text)
         
         try:
-            scenes = json.loads(response_text)
-        except json.JSONDecodeError:
+            scenes = orjson.loads(response_text)
+        except orjson.JSONDecodeError:
             # If JSON parsing fails, try to extract JSON from the response
             json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
             if json_match:
-                scenes = json.loads(json_match.group())
+                scenes = orjson.loads(json_match.group())
             else:
                 # Fallback: create a simple scene structure
                 scenes = [{
@@ -120,6 +98,6 @@ class SceneGenerator:
     def save_scenes(self, scenes: List[Dict], output_dir: str = OUTPUT_DIR):
         ensure_output_dir(output_dir)
         path = os.path.join(output_dir, SCENES_FILE)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(scenes, f, indent=2)
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(scenes, option=orjson.OPT_INDENT_2))
         print(f"Saved {len(scenes)} scenes to {path}")
@@ -0,0 +1,18 @@
+"""
+Document Text Extraction (runs in worker processes)
+"""
+import PyPDF2
+from docx import Document
+
+
+def extract_pdf_text(path: str) -> str:
+    """Extract text from all pages of a PDF file"""
+    with open(path, "rb") as f:
+        pdf_reader = PyPDF2.PdfReader(f)
+        return "\n".join([page.extract_text() for page in pdf_reader.pages])
+
+
+def extract_docx_text(path: str) -> str:
+    """Extract paragraph text from a DOCX file"""
+    doc = Document(path)
+    return "\n".join([paragraph.text for paragraph in doc.paragraphs])
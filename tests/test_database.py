@@ -0,0 +1,33 @@
+"""
+Database Search Tests
+"""
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+import pytest
+
+from src import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(database, "_pool", database.queue.LifoQueue(maxsize=database.POOL_SIZE))
+    database.init_db()
+    user = database.create_user("alice", "alice@example.com", "secret1")
+    return user["id"]
+
+
+@pytest.mark.parametrize("query", ["über", "ÜBER", "Über"])
+def test_search_matches_non_ascii_case_insensitively(db, query):
+    database.create_story(db, "Über Title", "A journey north", "Adventure", "Cinematic")
+    results = database.search_user_stories(db, query=query)
+    assert [story["title"] for story in results] == ["Über Title"]
+
+
+def test_search_treats_like_wildcards_literally(db):
+    database.create_story(db, "100% Real", "prompt", "Drama", "Noir")
+    database.create_story(db, "1000 Days", "prompt", "Drama", "Noir")
+    results = database.search_user_stories(db, query="100%")
+    assert [story["title"] for story in results] == ["100% Real"]
@@ -0,0 +1,45 @@
+"""
+Scene Generator Tests
+"""
+import os
+import re
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+from google.ai.generativelanguage_v1beta.types import GenerateContentResponse
+
+from src.scene_generator import SceneGenerator, SCENE_GENERATION_TIMEOUT, SCENE_TIMEOUT_MESSAGE
+
+SCENES_JSON = '[{"scene_number": 1, "scene_text": "Rain", "cinematic_prompt": "A rainy street"}]'
+
+
+class StubClient:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    def generate_content(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.error:
+            raise self.error
+        return GenerateContentResponse(
+            candidates=[{"content": {"role": "model", "parts": [{"text": SCENES_JSON}]}, "finish_reason": 1}]
+        )
+
+
+def test_generate_scenes_bounds_the_request():
+    scene_gen = SceneGenerator()
+    scene_gen.llm.client = StubClient()
+    scenes = scene_gen.generate_scenes("A detective in the rain")
+    assert [scene["scene_number"] for scene in scenes] == [1]
+    assert [call["timeout"] for call in scene_gen.llm.client.calls] == [SCENE_GENERATION_TIMEOUT]
+
+
+def test_generate_scenes_reports_deadline_as_timeout():
+    scene_gen = SceneGenerator()
+    scene_gen.llm.client = StubClient(google_exceptions.DeadlineExceeded("Deadline Exceeded"))
+    with pytest.raises(Exception, match=re.escape(SCENE_TIMEOUT_MESSAGE)):
+        scene_gen.generate_scenes("A detective in the rain")
+    assert all(call["timeout"] == SCENE_GENERATION_TIMEOUT for call in scene_gen.llm.client.calls)